@@ -0,0 +1,85 @@
+"""Process-wide mutable state for Block Watch.
+
+Streamlit re-executes the main script in a fresh module on every rerun,
+so globals defined there are recreated per widget interaction while
+long-lived threads keep references to the first run's copies. Anything
+shared between reruns and the auto-unblock thread lives here instead:
+imported modules are created once per process and cached in sys.modules.
+"""
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+class RWLock:
+    """Reader-writer lock: many concurrent readers, one exclusive writer.
+
+    Streamlit worker threads read the blocklist far more often than the
+    auto-unblocker writes it; a plain Lock would serialize those reads.
+    The write side is reentrant so a writer can call back into locked
+    helpers (e.g. log_action from within an expiry sweep).
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer: Optional[int] = None
+        self._depth = 0
+
+    @contextmanager
+    def read(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer != me:
+                while self._writer is not None:
+                    self._cond.wait()
+                self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                if self._writer != me:
+                    self._readers -= 1
+                    if self._readers == 0:
+                        self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._depth += 1
+            else:
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+                self._writer = me
+                self._depth = 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._writer = None
+                    self._cond.notify_all()
+
+# Guards all of the state below.
+lock = RWLock()
+
+# In-memory event history; None until first loaded from the JSONL store.
+blocklist: Optional[List[Dict]] = None
+writes_since_compact = 0
+
+# Index of currently blocked IPs plus a heap of (unblock_time, ip).
+active: Dict[str, datetime] = {}
+heap: List[Tuple[datetime, str]] = []
+
+# Set whenever a new block lands so the auto-unblocker can reschedule its
+# wait around the (possibly earlier) next expiry.
+unblock_wake = threading.Event()
+
+# One-per-process guards: the compaction atexit hook and the auto-unblock
+# thread.
+atexit_registered = False
+unblocker: Optional[threading.Thread] = None
+init_lock = threading.Lock()
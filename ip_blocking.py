@@ -1,296 +1,739 @@
-import json
-import subprocess
-import time
-import threading
-import streamlit as st
-import pandas as pd
-import plotly.express as px
-import socket
-from datetime import datetime, timedelta
-from pathlib import Path
-import logging
-from typing import List, Dict, Optional, Tuple
-import sys
-
-LOG_DIR = Path('logs')
-DATA_DIR = Path('data')
-LOG_DIR.mkdir(exist_ok=True)
-DATA_DIR.mkdir(exist_ok=True)
-
-BLOCKLIST_FILE = DATA_DIR / 'blocklist.json'
-ACTIONS_LOG = LOG_DIR / 'actions.log'
-FIREWALL_CMD = '/sbin/iptables'
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(ACTIONS_LOG),
-        logging.StreamHandler()
-    ]
-)
-
-def execute_firewall_command(cmd: List[str]) -> Tuple[bool, str]:
-    try:
-        result = subprocess.run(
-            ['sudo'] + cmd,
-            capture_output=True,
-            text=True,
-            check=True,
-            timeout=10
-        )
-        return True, ""
-    except subprocess.CalledProcessError as e:
-        error_msg = f"Command failed ({' '.join(cmd)}): {e.stderr}"
-        logging.error(error_msg)
-        return False, error_msg
-    except Exception as e:
-        error_msg = f"Unexpected error: {str(e)}"
-        logging.error(error_msg)
-        return False, error_msg
-
-def block_ip(ip: str) -> bool:
-    """Block an IP address for both incoming and outgoing traffic."""
-    success_in, _ = execute_firewall_command([FIREWALL_CMD, '-A', 'INPUT', '-s', ip, '-j', 'DROP'])
-    success_out, _ = execute_firewall_command([FIREWALL_CMD, '-A', 'OUTPUT', '-d', ip, '-j', 'DROP'])
-    
-    if success_in or success_out:
-        log_action(ip, 'blocked')
-    return success_in and success_out
-
-def unblock_ip(ip: str) -> bool:
-    """Unblock an IP address for both incoming and outgoing traffic."""
-    success_in, _ = execute_firewall_command([FIREWALL_CMD, '-D', 'INPUT', '-s', ip, '-j', 'DROP'])
-    success_out, _ = execute_firewall_command([FIREWALL_CMD, '-D', 'OUTPUT', '-d', ip, '-j', 'DROP'])
-
-    if success_in or success_out:
-        log_action(ip, 'unblocked')
-    return success_in and success_out
-
-def log_action(ip: str, action: str) -> None:
-    timestamp = datetime.now().isoformat()
-    log_entry = {"time": timestamp, "ip": ip, "action": action}
-
-    with open(ACTIONS_LOG, 'a') as log_file:
-        json.dump(log_entry, log_file)
-        log_file.write('\n')
-
-    try:
-        blocklist = load_blocklist()
-    except Exception as e:
-        logging.error(f"Error loading blocklist: {str(e)}")
-        blocklist = []
-
-    blocklist.append(log_entry)
-    save_blocklist(blocklist)
-
-def load_blocklist() -> List[Dict]:
-    try:
-        with open(BLOCKLIST_FILE, 'r') as file:
-            return json.load(file)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return []
-
-def save_blocklist(data: List[Dict]) -> None:
-    with open(BLOCKLIST_FILE, 'w') as file:
-        json.dump(data, file, indent=4)
-
-# ===================== Auto-Unblock System =====================
-class AutoUnblocker(threading.Thread):
-    def __init__(self):
-        super().__init__(daemon=True)
-        self.running = True
-        self.check_interval = 60
-
-    def run(self):
-        while self.running:
-            try:
-                self.check_expired_blocks()
-            except Exception as e:
-                logging.error(f"Auto-unblock error: {str(e)}")
-            time.sleep(self.check_interval)
-
-    def check_expired_blocks(self):
-        blocklist = load_blocklist()
-        updated_list = []
-        now = datetime.now()
-
-        for entry in blocklist:
-            if entry['action'] != 'blocked':
-                updated_list.append(entry)
-                continue
-
-            blocked_time = datetime.fromisoformat(entry['time'])
-            unblock_time = blocked_time + timedelta(hours=1)
-
-            if now > unblock_time:
-                if unblock_ip(entry['ip']):
-                    logging.info(f"Auto-unblocked IP: {entry['ip']}")
-                else:
-                    updated_list.append(entry)
-            else:
-                updated_list.append(entry)
-
-        save_blocklist(updated_list)
-
-# ===================== Visualization & Reporting =====================
-def get_blocked_ips_data() -> pd.DataFrame:
-    try:
-        blocklist = load_blocklist()
-        df = pd.DataFrame(blocklist)
-        if not df.empty:
-            df['time'] = pd.to_datetime(df['time'])
-        return df
-    except Exception as e:
-        logging.error(f"Error loading blocked IP data: {str(e)}")
-        return pd.DataFrame()
-
-def visualize_blocked_ips():
-    df = get_blocked_ips_data()
-    if df.empty:
-        st.warning("No blocked IPs to visualize.")
-        return
-
-    blocked = df[df['action'] == 'blocked']
-    if blocked.empty:
-        st.warning("No currently blocked IPs.")
-        return
-
-    fig = px.timeline(
-        blocked,
-        x_start="time",
-        x_end="time",
-        y="ip",
-        title="Blocked IPs Timeline",
-        labels={"ip": "IP Address", "time": "Block Time"}
-    )
-    st.plotly_chart(fig)
-
-    st.subheader("Blocking Statistics")
-    col1, col2 = st.columns(2)
-    col1.metric("Total Blocks", len(blocked))
-    col2.metric("Unique IPs", blocked['ip'].nunique())
-
-# ===================== DNS Lookup =====================
-def lookup_ips(domain: str) -> List[str]:
-    try:
-        if not domain:
-            raise ValueError("Domain cannot be empty")
-
-        results = socket.getaddrinfo(domain, None)
-        ips = list({result[4][0] for result in results})
-        return ips if ips else []
-    except Exception as e:
-        logging.error(f"DNS lookup failed for {domain}: {str(e)}")
-        return []
-
-def init_session_state():
-    if 'domain_ips' not in st.session_state:
-        st.session_state.domain_ips = []
-    if 'unblocker' not in st.session_state:
-        st.session_state.unblocker = AutoUnblocker()
-        st.session_state.unblocker.start()
-
-def show_manual_blocking():
-    st.subheader("Manual IP Management")
-    ip = st.text_input("Enter IP Address:", key="manual_ip")
-    
-    col1, col2 = st.columns(2)
-    if col1.button("Block IP"):
-        if ip:
-            if block_ip(ip):
-                st.success(f"IP {ip} blocked successfully!")
-                st.rerun()
-            else:
-                st.error(f"Failed to block IP {ip}")
-        else:
-            st.error("Please enter a valid IP address")
-
-    if col2.button("Unblock IP"):
-        if ip:
-            if unblock_ip(ip):
-                st.success(f"IP {ip} unblocked successfully!")
-                st.rerun()
-            else:
-                st.error(f"Failed to unblock IP {ip}")
-        else:
-            st.error("Please enter a valid IP address")
-
-def show_domain_lookup():
-    st.subheader("Domain IP Lookup")
-    domain = st.text_input("Enter Domain (e.g., google.com):", key="domain_input")
-    
-    if st.button("Lookup IPs"):
-        if domain:
-            ips = lookup_ips(domain)
-            if ips:
-                st.session_state.domain_ips = ips
-                st.success(f"Found {len(ips)} IP addresses")
-            else:
-                st.warning("No IP addresses found for this domain")
-        else:
-            st.warning("Please enter a domain name")
-
-    if st.session_state.domain_ips:
-        selected_ip = st.selectbox(
-            "Select IP to block:",
-            st.session_state.domain_ips,
-            key="ip_select"
-        )
-        if st.button("Block Selected IP"):
-            if block_ip(selected_ip):
-                st.success(f"IP {selected_ip} blocked successfully!")
-                st.rerun()
-            else:
-                st.error(f"Failed to block IP {selected_ip}")
-
-def show_blocked_ips():
-    st.subheader("Blocked IPs Overview")
-    visualize_blocked_ips()
-
-    if st.checkbox("Show raw blocked IP data"):
-        df = get_blocked_ips_data()
-        if not df.empty:
-            st.dataframe(df.sort_values('time', ascending=False))
-        else:
-            st.info("No blocked IP data available")
-
-def main():
-    st.set_page_config(
-        page_title="Block Watch — Real-Time IP Defense",
-        page_icon="🛡️",
-        layout="wide"
-    )
-    
-    st.title("🛡️ Block Watch — Real-Time IP Defense")
-    st.markdown("A comprehensive tool for blocking and monitoring IP addresses.")
-    
-    init_session_state()
-    
-    tab1, tab2, tab3 = st.tabs(["Manual Blocking", "Domain Lookup", "Blocked IPs"])
-    
-    with tab1:
-        show_manual_blocking()
-    
-    with tab2:
-        show_domain_lookup()
-    
-    with tab3:
-        show_blocked_ips()
-    
-    st.sidebar.header("System Information")
-    st.sidebar.code(f"Python: {sys.version.split()[0]}")
-    st.sidebar.code(f"Streamlit: {st.__version__}")
-    
-    if st.sidebar.checkbox("Show logs"):
-        st.sidebar.subheader("Recent Logs")
-        try:
-            with open(ACTIONS_LOG, 'r') as f:
-                logs = f.readlines()[-20:]
-            st.sidebar.code(''.join(logs))
-        except FileNotFoundError:
-            st.sidebar.warning("No log file found")
-
-if __name__ == "__main__":
-    main()
+import asyncio
+import atexit
+import errno
+import heapq
+import json
+import os
+import subprocess
+import threading
+import streamlit as st
+import pandas as pd
+import plotly.express as px
+import socket
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+import logging
+from typing import List, Dict, Optional, Tuple
+import sys
+
+try:
+    # Optional: with pyroute2 installed (and CAP_NET_ADMIN in-process),
+    # set updates go straight to the kernel over netlink instead of
+    # forking the ipset binary per batch.
+    from pyroute2 import IPSet as NetlinkIPSet
+except ImportError:
+    NetlinkIPSet = None
+
+try:
+    # Optional: c-ares resolver so A and AAAA queries run concurrently
+    # instead of serially blocking in getaddrinfo.
+    import aiodns
+except ImportError:
+    aiodns = None
+
+import blockwatch_state as _state
+
+LOG_DIR = Path('logs')
+DATA_DIR = Path('data')
+LOG_DIR.mkdir(exist_ok=True)
+DATA_DIR.mkdir(exist_ok=True)
+
+BLOCKLIST_FILE = DATA_DIR / 'blocklist.jsonl'
+LEGACY_BLOCKLIST_FILE = DATA_DIR / 'blocklist.json'
+ACTIONS_LOG = LOG_DIR / 'actions.log'
+EVENTS_LOG = LOG_DIR / 'events.jsonl'
+FIREWALL_CMD = '/sbin/iptables'
+FIREWALL_RESTORE_CMD = '/sbin/iptables-restore'
+IPSET_CMD = '/sbin/ipset'
+IPSET_NAME = 'blockwatch'
+BLOCK_TIMEOUT = 3600  # seconds; matches the 1-hour auto-unblock window
+
+# sudo adds a fork + auth round-trip (~tens of ms) to every firewall call.
+# Skip it when we already run as root, or when BLOCKWATCH_NO_SUDO=1 and the
+# interpreter has been granted CAP_NET_ADMIN directly, e.g.:
+#   setcap cap_net_admin,cap_net_raw+ep $(readlink -f $(which python3))
+if os.geteuid() == 0 or os.environ.get('BLOCKWATCH_NO_SUDO') == '1':
+    SUDO_PREFIX: List[str] = []
+else:
+    SUDO_PREFIX = ['sudo']
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler(ACTIONS_LOG),
+        logging.StreamHandler()
+    ]
+)
+
+class _JsonFormatter(logging.Formatter):
+    """Render block/unblock events as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps({
+            'time': datetime.fromtimestamp(record.created).isoformat(),
+            'ip': getattr(record, 'ip', None),
+            'action': getattr(record, 'action', None),
+        })
+
+# Structured events go to their own JSONL file so ACTIONS_LOG stays purely
+# human-readable instead of interleaving two formats. The handler guard
+# keeps Streamlit reruns from stacking duplicate handlers.
+_action_logger = logging.getLogger('actions')
+if not _action_logger.handlers:
+    _action_logger.propagate = False
+    _events_handler = logging.FileHandler(EVENTS_LOG)
+    _events_handler.setFormatter(_JsonFormatter())
+    _action_logger.addHandler(_events_handler)
+
+def execute_firewall_command(cmd: List[str], quiet: bool = True) -> Tuple[bool, str]:
+    # Nothing reads stdout on success; discarding it skips the pipe
+    # buffer and UTF-8 decode per call. stderr is still captured so
+    # failures carry their message.
+    try:
+        subprocess.run(
+            SUDO_PREFIX + cmd,
+            stdout=subprocess.DEVNULL if quiet else subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            check=True,
+            timeout=10
+        )
+        return True, ""
+    except subprocess.CalledProcessError as e:
+        error_msg = f"Command failed ({' '.join(cmd)}): {e.stderr}"
+        logging.error(error_msg)
+        return False, error_msg
+    except Exception as e:
+        error_msg = f"Unexpected error: {str(e)}"
+        logging.error(error_msg)
+        return False, error_msg
+
+def _rule_exists(rule: List[str]) -> bool:
+    """Probe for an existing iptables rule (-C) without logging the miss."""
+    try:
+        subprocess.run(SUDO_PREFIX + rule, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, check=True, timeout=10)
+        return True
+    except Exception:
+        return False
+
+_netlink_ipset = None  # open pyroute2 handle when the netlink path is active
+
+def _init_netlink_ipset() -> bool:
+    """Try to create the set over netlink, keeping the socket for reuse."""
+    global _netlink_ipset
+    if NetlinkIPSet is None:
+        return False
+    try:
+        handle = NetlinkIPSet()
+        handle.create(IPSET_NAME, stype='hash:ip',
+                      timeout=BLOCK_TIMEOUT, exclusive=False)
+        _netlink_ipset = handle
+        return True
+    except Exception as e:
+        logging.info(f"netlink ipset unavailable ({str(e)}); using the ipset binary")
+        return False
+
+def init_ipset() -> bool:
+    """Create the blockwatch ipset and the two iptables rules that reference it.
+
+    A hash:ip set gives O(1) kernel-side matching regardless of blocklist
+    size, and adding/removing an IP becomes a single netlink call instead
+    of a full ruleset rewrite. Returns False when ipset or its match-set
+    rules are unavailable so callers can fall back to per-IP iptables
+    rules.
+    """
+    global _netlink_ipset
+    if not _init_netlink_ipset():
+        success, _ = execute_firewall_command(
+            [IPSET_CMD, 'create', IPSET_NAME, 'hash:ip', 'timeout', str(BLOCK_TIMEOUT), '-exist']
+        )
+        if not success:
+            logging.warning("ipset unavailable; falling back to per-IP iptables rules")
+            return False
+
+    # An ipset with no rule referencing it drops nothing; if either DROP
+    # rule cannot be inserted, report failure so blocks fall back to the
+    # per-IP path instead of silently landing in an unreferenced set.
+    match_rules = [
+        ['INPUT', '-m', 'set', '--match-set', IPSET_NAME, 'src', '-j', 'DROP'],
+        ['OUTPUT', '-m', 'set', '--match-set', IPSET_NAME, 'dst', '-j', 'DROP'],
+    ]
+    for rule in match_rules:
+        if not _rule_exists([FIREWALL_CMD, '-C'] + rule):
+            success, _ = execute_firewall_command([FIREWALL_CMD, '-I'] + rule)
+            if not success:
+                logging.warning(
+                    "could not insert the match-set DROP rules; "
+                    "falling back to per-IP iptables rules"
+                )
+                _netlink_ipset = None
+                return False
+    return True
+
+_ipset_state: Optional[bool] = None
+
+def _ipset_ready() -> bool:
+    global _ipset_state
+    if _ipset_state is None:
+        _ipset_state = init_ipset()
+    return _ipset_state
+
+# Rule-line segments, built once at import; only the IP varies per call.
+# The iptables-restore payload is assembled from byte constants so large
+# batches are a b''.join with no per-rule format machinery.
+_BATCH_HEADER = b'*filter\n'
+_BATCH_FOOTER = b'COMMIT\n'
+_IN_PREFIX = {'-A': b'-A INPUT -s ', '-D': b'-D INPUT -s '}
+_OUT_PREFIX = {'-A': b'-A OUTPUT -d ', '-D': b'-D OUTPUT -d '}
+_DROP_SUFFIX = b' -j DROP\n'
+_IPSET_ADD_TMPL = f'add {IPSET_NAME} {{ip}} timeout {BLOCK_TIMEOUT}'
+_IPSET_DEL_TMPL = f'del {IPSET_NAME} {{ip}}'
+
+# Kernel reply when deleting an entry that is not in the set
+# (linux/netfilter/ipset/ip_set.h, enum ipset_cmd_error).
+_IPSET_ERR_EXIST = 4103
+
+def _ipset_batch(op: str, ips: List[str]) -> Tuple[bool, str]:
+    """Add or delete many set entries without forking per IP.
+
+    Prefers direct netlink calls on the persistent pyroute2 socket; falls
+    back to a single `ipset restore` invocation fed over stdin.
+    """
+    if _netlink_ipset is not None:
+        for ip in ips:
+            if op == 'add':
+                try:
+                    _netlink_ipset.add(IPSET_NAME, ip,
+                                       timeout=BLOCK_TIMEOUT, exclusive=False)
+                except Exception as e:
+                    # A failed add means no kernel-side block; report it
+                    # like the subprocess backends do so the caller does
+                    # not log a bogus 'blocked' entry.
+                    error_msg = f"netlink ipset add {ip} failed: {str(e)}"
+                    logging.error(error_msg)
+                    return False, error_msg
+            else:
+                try:
+                    _netlink_ipset.delete(IPSET_NAME, ip)
+                except Exception as e:
+                    # A missing entry just means the kernel-side timeout
+                    # beat us to it; anything else (EPERM, closed socket,
+                    # vanished set) must not record 'unblocked' for an IP
+                    # the kernel still blocks.
+                    if getattr(e, 'code', None) in (errno.ENOENT, _IPSET_ERR_EXIST):
+                        logging.debug(f"netlink ipset del {ip}: {str(e)}")
+                    else:
+                        error_msg = f"netlink ipset del {ip} failed: {str(e)}"
+                        logging.error(error_msg)
+                        return False, error_msg
+        return True, ""
+
+    if op == 'add':
+        lines = [_IPSET_ADD_TMPL.format(ip=ip) for ip in ips]
+    else:
+        lines = [_IPSET_DEL_TMPL.format(ip=ip) for ip in ips]
+
+    try:
+        subprocess.run(
+            SUDO_PREFIX + [IPSET_CMD, 'restore', '-exist'],
+            input='\n'.join(lines) + '\n',
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+            check=True,
+            timeout=10
+        )
+        return True, ""
+    except subprocess.CalledProcessError as e:
+        error_msg = f"ipset batch {op} failed ({len(ips)} entries): {e.stderr}"
+        logging.error(error_msg)
+        return False, error_msg
+    except Exception as e:
+        error_msg = f"Unexpected error: {str(e)}"
+        logging.error(error_msg)
+        return False, error_msg
+
+def apply_rules_batch(rules: List[Tuple[str, str]]) -> Tuple[bool, str]:
+    """Apply many INPUT/OUTPUT DROP rules in one iptables-restore call.
+
+    Each rule is an (op, ip) pair where op is '-A' to add or '-D' to delete.
+    Feeding the whole set through a single `iptables-restore --noflush`
+    avoids one userspace->kernel table copy (and two sudo forks) per IP.
+    """
+    if not rules:
+        return True, ""
+
+    parts = [_BATCH_HEADER]
+    for op, ip in rules:
+        ip_bytes = ip.encode()
+        parts.append(_IN_PREFIX[op] + ip_bytes + _DROP_SUFFIX)
+        parts.append(_OUT_PREFIX[op] + ip_bytes + _DROP_SUFFIX)
+    parts.append(_BATCH_FOOTER)
+    ruleset = b''.join(parts)
+
+    try:
+        subprocess.run(
+            SUDO_PREFIX + [FIREWALL_RESTORE_CMD, '--noflush'],
+            input=ruleset,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            check=True,
+            timeout=10
+        )
+        return True, ""
+    except subprocess.CalledProcessError as e:
+        stderr = e.stderr.decode('utf-8', errors='replace') if e.stderr else ''
+        error_msg = f"Batch rule update failed ({len(rules)} rules): {stderr}"
+        logging.error(error_msg)
+        return False, error_msg
+    except Exception as e:
+        error_msg = f"Unexpected error: {str(e)}"
+        logging.error(error_msg)
+        return False, error_msg
+
+def block_ips(ips: List[str]) -> bool:
+    """Block a list of IP addresses in a single batched firewall update."""
+    if _ipset_ready():
+        success, _ = _ipset_batch('add', ips)
+    else:
+        success, _ = apply_rules_batch([('-A', ip) for ip in ips])
+    if success:
+        for ip in ips:
+            log_action(ip, 'blocked')
+    return success
+
+def unblock_ips(ips: List[str]) -> bool:
+    """Unblock a list of IP addresses in a single batched firewall update."""
+    if _ipset_ready():
+        success, _ = _ipset_batch('del', ips)
+    else:
+        success, _ = apply_rules_batch([('-D', ip) for ip in ips])
+    if success:
+        for ip in ips:
+            log_action(ip, 'unblocked')
+    return success
+
+def block_ip(ip: str) -> bool:
+    """Block an IP address for both incoming and outgoing traffic."""
+    return block_ips([ip])
+
+def unblock_ip(ip: str) -> bool:
+    """Unblock an IP address for both incoming and outgoing traffic."""
+    return unblock_ips([ip])
+
+# The blocklist lives in memory and is persisted append-only as JSONL, so
+# logging an action is an O(1) append instead of a full parse + rewrite of
+# the growing file. The store is rewritten only on compaction. The cache,
+# its indexes and the RWLock guarding them live in blockwatch_state so
+# Streamlit reruns and the auto-unblock thread all see the same copies —
+# a lock recreated per rerun would not synchronize anything.
+_COMPACT_EVERY = 1000
+
+def _rebuild_active_index(entries: List[Dict]) -> None:
+    """Replay the event history into the active-IP dict and expiry heap.
+
+    Caller must hold the _state.lock write lock.
+    """
+    _state.active.clear()
+    for entry in entries:
+        if entry['action'] == 'blocked':
+            _state.active[entry['ip']] = datetime.fromisoformat(entry['time'])
+        elif entry['action'] == 'unblocked':
+            _state.active.pop(entry['ip'], None)
+    _state.heap.clear()
+    _state.heap.extend(
+        (blocked_time + timedelta(hours=1), ip)
+        for ip, blocked_time in _state.active.items()
+    )
+    heapq.heapify(_state.heap)
+
+def _load_blocklist_locked() -> List[Dict]:
+    """Return the in-memory blocklist, reading the store once on first use.
+
+    Caller must hold the _state.lock write lock (the first call populates the
+    cache; later read-only callers may hold the read lock instead).
+    """
+    if _state.blocklist is None:
+        entries = []
+        try:
+            with open(BLOCKLIST_FILE, 'r') as file:
+                for line in file:
+                    line = line.strip()
+                    if line:
+                        entries.append(json.loads(line))
+        except FileNotFoundError:
+            # Migrate from the old single-document JSON store if present.
+            try:
+                with open(LEGACY_BLOCKLIST_FILE, 'r') as file:
+                    entries = json.load(file)
+            except (FileNotFoundError, json.JSONDecodeError):
+                entries = []
+        except json.JSONDecodeError as e:
+            logging.error(f"Error loading blocklist: {str(e)}")
+            entries = []
+        _state.blocklist = entries
+        _rebuild_active_index(entries)
+    return _state.blocklist
+
+def log_action(ip: str, action: str) -> None:
+    timestamp = datetime.now().isoformat()
+    log_entry = {"time": timestamp, "ip": ip, "action": action}
+
+    _action_logger.info("%s %s", action, ip, extra={"ip": ip, "action": action})
+
+    with _state.lock.write():
+        _load_blocklist_locked().append(log_entry)
+        if action == 'blocked':
+            blocked_time = datetime.fromisoformat(timestamp)
+            _state.active[ip] = blocked_time
+            heapq.heappush(_state.heap, (blocked_time + timedelta(hours=1), ip))
+            _state.unblock_wake.set()
+        elif action == 'unblocked':
+            _state.active.pop(ip, None)
+        with open(BLOCKLIST_FILE, 'a') as file:
+            file.write(json.dumps(log_entry) + '\n')
+        _state.writes_since_compact += 1
+        compact_needed = _state.writes_since_compact >= _COMPACT_EVERY
+
+    if compact_needed:
+        compact_blocklist()
+
+def load_blocklist() -> List[Dict]:
+    if _state.blocklist is None:
+        with _state.lock.write():
+            _load_blocklist_locked()
+    with _state.lock.read():
+        return list(_load_blocklist_locked())
+
+def save_blocklist(data: List[Dict]) -> None:
+    """Replace the blocklist and rewrite the JSONL store in full.
+
+    The rewrite goes to a sibling temp file first and is swapped in with
+    os.replace, so a crash mid-write can never leave a truncated store.
+    """
+    with _state.lock.write():
+        _state.blocklist = list(data)
+        _rebuild_active_index(_state.blocklist)
+        tmp_file = BLOCKLIST_FILE.with_suffix('.tmp')
+        with open(tmp_file, 'w') as file:
+            for entry in _state.blocklist:
+                file.write(json.dumps(entry) + '\n')
+        os.replace(tmp_file, BLOCKLIST_FILE)
+        _state.writes_since_compact = 0
+
+def compact_blocklist() -> None:
+    """Rewrite the append-only store from the in-memory list."""
+    save_blocklist(load_blocklist())
+
+# Register once per process, not per rerun: re-registering on every
+# script re-execution would grow the atexit table without bound.
+if not _state.atexit_registered:
+    atexit.register(compact_blocklist)
+    _state.atexit_registered = True
+
+# ===================== Auto-Unblock System =====================
+class AutoUnblocker(threading.Thread):
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.running = True
+        self.max_wait = 3600  # upper bound when nothing is scheduled
+        self.retry_interval = 60  # delay before retrying a failed unblock
+
+    def run(self):
+        # Sleep until the nearest scheduled expiry instead of polling on a
+        # fixed interval; a new block sets _state.unblock_wake to reschedule.
+        while self.running:
+            try:
+                self.check_expired_blocks()
+            except Exception as e:
+                logging.error(f"Auto-unblock error: {str(e)}")
+            _state.unblock_wake.wait(timeout=self._seconds_until_next_expiry())
+            _state.unblock_wake.clear()
+
+    def _seconds_until_next_expiry(self) -> float:
+        with _state.lock.read():
+            if _state.heap:
+                return max(
+                    0.0, (_state.heap[0][0] - datetime.now()).total_seconds())
+        return self.max_wait
+
+    def check_expired_blocks(self):
+        # Hold the write lock across the whole pop-and-unblock so a block
+        # logged mid-sweep cannot be missed or double-handled.
+        with _state.lock.write():
+            _load_blocklist_locked()  # ensure the active index is populated
+            now = datetime.now()
+            expired_ips = []
+
+            while _state.heap and _state.heap[0][0] <= now:
+                _, ip = heapq.heappop(_state.heap)
+                blocked_time = _state.active.get(ip)
+                # Skip stale heap entries: the IP was unblocked already or
+                # re-blocked later (which pushed a fresher entry).
+                if blocked_time is None or blocked_time + timedelta(hours=1) > now:
+                    continue
+                expired_ips.append(ip)
+
+            if not expired_ips:
+                return
+
+            if unblock_ips(expired_ips):
+                for ip in expired_ips:
+                    logging.info(f"Auto-unblocked IP: {ip}")
+            else:
+                # Re-push with a future deadline, not the original expired
+                # one: an already-past deadline would make the event wait
+                # time out immediately and hot-spin the thread against a
+                # persistently failing firewall command.
+                retry_at = now + timedelta(seconds=self.retry_interval)
+                for ip in expired_ips:
+                    if ip in _state.active:
+                        heapq.heappush(_state.heap, (retry_at, ip))
+
+# ===================== Visualization & Reporting =====================
+@st.cache_data(ttl=30)
+def _load_blocklist_df(mtime: float) -> pd.DataFrame:
+    """Build the blocklist DataFrame, memoized on the store's mtime.
+
+    Streamlit reruns the whole script on every widget interaction; keying
+    the cache on the file's mtime lets tab switches reuse the parsed frame
+    until the blocklist actually changes.
+    """
+    df = pd.DataFrame.from_records(load_blocklist())
+    if not df.empty:
+        # Timestamps are written with datetime.isoformat(); naming the
+        # format keeps pandas on its C parser instead of inferring per
+        # value, and cache=True dedups repeated stamps.
+        df['time'] = pd.to_datetime(df['time'], format='ISO8601', cache=True)
+        df['ip'] = df['ip'].astype('category')
+        df['action'] = df['action'].astype('category')
+    return df
+
+def get_blocked_ips_data() -> pd.DataFrame:
+    try:
+        try:
+            mtime = BLOCKLIST_FILE.stat().st_mtime
+        except FileNotFoundError:
+            mtime = 0.0
+        return _load_blocklist_df(mtime)
+    except Exception as e:
+        logging.error(f"Error loading blocked IP data: {str(e)}")
+        return pd.DataFrame()
+
+@st.cache_data(ttl=30)
+def _build_timeline(mtime: float):
+    """Build the timeline figure, memoized on the store's mtime.
+
+    Serializing a Plotly figure to JSON is pure Python and measurable for
+    large frames; caching it alongside the DataFrame means tab switches
+    reuse the built figure until the blocklist changes.
+    """
+    blocked = _load_blocklist_df(mtime)
+    if not blocked.empty:
+        blocked = blocked[blocked['action'] == 'blocked']
+    if blocked.empty:
+        return None, 0, 0
+
+    fig = px.timeline(
+        blocked,
+        x_start="time",
+        x_end="time",
+        y="ip",
+        title="Blocked IPs Timeline",
+        labels={"ip": "IP Address", "time": "Block Time"}
+    )
+    return fig, len(blocked), blocked['ip'].nunique()
+
+def visualize_blocked_ips():
+    df = get_blocked_ips_data()
+    if df.empty:
+        st.warning("No blocked IPs to visualize.")
+        return
+
+    try:
+        mtime = BLOCKLIST_FILE.stat().st_mtime
+    except FileNotFoundError:
+        mtime = 0.0
+    fig, total_blocks, unique_ips = _build_timeline(mtime)
+    if fig is None:
+        st.warning("No currently blocked IPs.")
+        return
+
+    st.plotly_chart(fig)
+
+    st.subheader("Blocking Statistics")
+    col1, col2 = st.columns(2)
+    col1.metric("Total Blocks", total_blocks)
+    col2.metric("Unique IPs", unique_ips)
+
+# ===================== DNS Lookup =====================
+async def _resolve_async(domain: str) -> List[str]:
+    """Resolve A and AAAA records concurrently via c-ares."""
+    resolver = aiodns.DNSResolver()
+    answers = await asyncio.gather(
+        resolver.query(domain, 'A'),
+        resolver.query(domain, 'AAAA'),
+        return_exceptions=True,
+    )
+    ips = set()
+    for answer in answers:
+        if isinstance(answer, Exception):
+            continue
+        ips.update(record.host for record in answer)
+    return list(ips)
+
+@st.cache_data(ttl=300, show_spinner=False)
+def lookup_ips(domain: str) -> List[str]:
+    """Resolve a domain to its IPs, memoized per domain for five minutes."""
+    try:
+        if not domain:
+            raise ValueError("Domain cannot be empty")
+
+        if aiodns is not None:
+            ips = asyncio.run(_resolve_async(domain))
+        else:
+            results = socket.getaddrinfo(domain, None)
+            ips = list({result[4][0] for result in results})
+        return ips if ips else []
+    except Exception as e:
+        logging.error(f"DNS lookup failed for {domain}: {str(e)}")
+        return []
+
+def tail_log(path: Path, lines: int = 20) -> List[str]:
+    """Return the last `lines` lines of a file without reading all of it.
+
+    Seeks to a fixed window before EOF, so memory use stays constant no
+    matter how large the log grows.
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        f.seek(max(0, size - 8192))
+        raw = f.read().splitlines()[-lines:]
+    return [line.decode('utf-8', errors='replace') for line in raw]
+
+def init_session_state():
+    if 'domain_ips' not in st.session_state:
+        st.session_state.domain_ips = []
+    # One auto-unblock thread per process, not per session: the thread and
+    # everything it touches live in blockwatch_state, so later reruns keep
+    # feeding the same heap the thread waits on.
+    with _state.init_lock:
+        if _state.unblocker is None:
+            _state.unblocker = AutoUnblocker()
+            _state.unblocker.start()
+
+def show_manual_blocking():
+    st.subheader("Manual IP Management")
+    ip = st.text_input("Enter IP Address:", key="manual_ip")
+    
+    col1, col2 = st.columns(2)
+    if col1.button("Block IP"):
+        if ip:
+            if block_ip(ip):
+                st.success(f"IP {ip} blocked successfully!")
+                st.rerun()
+            else:
+                st.error(f"Failed to block IP {ip}")
+        else:
+            st.error("Please enter a valid IP address")
+
+    if col2.button("Unblock IP"):
+        if ip:
+            if unblock_ip(ip):
+                st.success(f"IP {ip} unblocked successfully!")
+                st.rerun()
+            else:
+                st.error(f"Failed to unblock IP {ip}")
+        else:
+            st.error("Please enter a valid IP address")
+
+def show_domain_lookup():
+    st.subheader("Domain IP Lookup")
+    domain = st.text_input("Enter Domain (e.g., google.com):", key="domain_input")
+    
+    if st.button("Lookup IPs"):
+        if domain:
+            ips = lookup_ips(domain)
+            if ips:
+                st.session_state.domain_ips = ips
+                st.success(f"Found {len(ips)} IP addresses")
+            else:
+                st.warning("No IP addresses found for this domain")
+        else:
+            st.warning("Please enter a domain name")
+
+    if st.session_state.domain_ips:
+        selected_ip = st.selectbox(
+            "Select IP to block:",
+            st.session_state.domain_ips,
+            key="ip_select"
+        )
+        col1, col2 = st.columns(2)
+        if col1.button("Block Selected IP"):
+            if block_ip(selected_ip):
+                st.success(f"IP {selected_ip} blocked successfully!")
+                st.rerun()
+            else:
+                st.error(f"Failed to block IP {selected_ip}")
+
+        if col2.button("Block All Resolved IPs"):
+            # One batched firewall update for the whole set instead of a
+            # fork-and-commit per IP.
+            ips = st.session_state.domain_ips
+            if block_ips(ips):
+                st.success(f"Blocked all {len(ips)} resolved IPs!")
+                st.rerun()
+            else:
+                st.error("Failed to block resolved IPs")
+
+def show_blocked_ips():
+    st.subheader("Blocked IPs Overview")
+    visualize_blocked_ips()
+
+    if st.checkbox("Show raw blocked IP data"):
+        df = get_blocked_ips_data()
+        if not df.empty:
+            st.dataframe(df.sort_values('time', ascending=False))
+        else:
+            st.info("No blocked IP data available")
+
+def main():
+    st.set_page_config(
+        page_title="Block Watch — Real-Time IP Defense",
+        page_icon="🛡️",
+        layout="wide"
+    )
+    
+    st.title("🛡️ Block Watch — Real-Time IP Defense")
+    st.markdown("A comprehensive tool for blocking and monitoring IP addresses.")
+    
+    init_session_state()
+    
+    tab1, tab2, tab3 = st.tabs(["Manual Blocking", "Domain Lookup", "Blocked IPs"])
+    
+    with tab1:
+        show_manual_blocking()
+    
+    with tab2:
+        show_domain_lookup()
+    
+    with tab3:
+        show_blocked_ips()
+    
+    st.sidebar.header("System Information")
+    st.sidebar.code(f"Python: {sys.version.split()[0]}")
+    st.sidebar.code(f"Streamlit: {st.__version__}")
+    
+    if st.sidebar.checkbox("Show logs"):
+        st.sidebar.subheader("Recent Logs")
+        try:
+            st.sidebar.code('\n'.join(tail_log(ACTIONS_LOG)))
+        except FileNotFoundError:
+            st.sidebar.warning("No log file found")
+
+if __name__ == "__main__":
+    main()